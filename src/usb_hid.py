@@ -11,12 +11,26 @@ For now using report ids in the descriptor
 * Author(s): Björn Bösel
 """
 
-from typing import Sequence, Dict
+# pylint: disable=too-many-lines
+
+from typing import Sequence, Dict, Iterator, List, Tuple
 from pathlib import Path
 import os
 import atexit
+import contextlib
+import select
+import selectors
 import sys
 import gzip
+import functools
+import threading
+import weakref
+
+try:
+    # Used only for typing
+    from circuitpython_typing import ReadableBuffer
+except ImportError:
+    pass
 
 MODULE_CONFIG = {
     "dwc2": "CONFIG_USB_DWC2",
@@ -56,12 +70,19 @@ def _read_kernel_config() -> set[str]:
     return symbols
 
 
-def _module_available(module: str, config_symbol: str, config_lines: set[str]) -> bool:
-    modules_txt = _safe_read_text(Path("/proc/modules"))
-    for line in modules_txt.splitlines():
-        parts = line.split()
-        if parts and parts[0] == module:
-            return True
+def _read_loaded_modules() -> set[bytes]:
+    try:
+        modules = Path("/proc/modules").read_bytes()
+    except OSError:
+        return set()
+    return {line.split(b" ", 1)[0] for line in modules.splitlines() if line}
+
+
+def _module_available(
+    module: str, config_symbol: str, loaded_modules: set[bytes], config_lines: set[str]
+) -> bool:
+    if module.encode() in loaded_modules:
+        return True
     if Path(f"/sys/module/{module}").exists():
         return True
     for suffix in ("=y", "=m"):
@@ -71,9 +92,10 @@ def _module_available(module: str, config_symbol: str, config_lines: set[str]) -
 
 
 _CONFIG_CACHE = _read_kernel_config()
+_MODULES_CACHE = _read_loaded_modules()
 
 for module, config_symbol in MODULE_CONFIG.items():
-    if _module_available(module, config_symbol, _CONFIG_CACHE):
+    if _module_available(module, config_symbol, _MODULES_CACHE, _CONFIG_CACHE):
         continue
     print("%s module not present in your kernel. did you insmod it?" % module)
 
@@ -83,6 +105,24 @@ this.gadget_root = "/sys/kernel/config/usb_gadget/adafruit-blinka"
 this.boot_device = 0
 this.devices = []
 
+# Readiness of all cached device fds for HID OUT reports, see Device.poll_all()
+_selector = selectors.DefaultSelector()
+
+
+@functools.lru_cache(maxsize=32)
+def _resolve_hidg(gadget_root: str, report_id: int) -> str:
+    """
+    Resolve the /dev/hidg node of a gadget's HID function from sysfs.
+    Cached, as the mapping is stable until the gadget is torn down.
+    """
+    fd = os.open(f"{gadget_root}/functions/hid.usb{report_id}/dev", os.O_RDONLY)
+    try:
+        dev = os.read(fd, 64)  # "<major>:<minor>\n"
+    finally:
+        os.close(fd)
+    minor = dev.split(b":", 1)[1].strip().decode("ascii")
+    return f"/dev/hidg{minor}"
+
 
 class Device:
     """
@@ -90,13 +130,31 @@ class Device:
     https://github.com/adafruit/circuitpython/blob/main/shared-bindings/usb_hid/Device.c
     """
 
+    # pylint: disable=too-many-instance-attributes
+
     KEYBOARD = None
     BOOT_KEYBOARD = None
     MOUSE = None
     BOOT_MOUSE = None
     CONSUMER_CONTROL = None
 
-    _device_fds: Dict[str, int] = {}  # Cache for file descriptors
+    __slots__ = (
+        "out_report_lengths",
+        "in_report_lengths",
+        "report_ids",
+        "usage",
+        "usage_page",
+        "descriptor",
+        "name",
+        "path",
+        "_last_received_report",
+        "_rid0",
+        "_out_len0",
+        "_fd_lock",
+        "_prefix",
+        "_device_fds",
+        "__weakref__",
+    )
 
     def __init__(
         self,
@@ -109,15 +167,32 @@ class Device:
         out_report_lengths: Sequence[int],
         name: str,
     ) -> None:
-        self.out_report_lengths = out_report_lengths
-        self.in_report_lengths = in_report_lengths
-        self.report_ids = report_ids
+        # Set first, __del__ closes them even if the checks below raise
+        self._device_fds: Dict[str, int] = {}  # Cache for file descriptors
+        self._fd_lock = threading.Lock()  # Guards opening of cached fds
+        self.out_report_lengths = tuple(out_report_lengths)
+        self.in_report_lengths = tuple(in_report_lengths)
+        self.report_ids = tuple(report_ids)
+        if not self.report_ids:
+            raise ValueError("report_ids must not be empty")
+        if len(self.in_report_lengths) < len(self.report_ids):
+            # enable() zips them, which would skip the ids left without a length
+            raise ValueError("in_report_lengths must have a length per report id")
         self.usage = usage
         self.usage_page = usage_page
         self.descriptor = descriptor
         self.name = name
         self.path = None
         self._last_received_report = None
+        # First report id and OUT report length, used by the send/read paths
+        self._rid0 = self.report_ids[0]
+        self._out_len0 = self.out_report_lengths[0] if self.out_report_lengths else 0
+        # Report id byte prepended to outgoing reports
+        self._prefix: Dict[int, bytes] = {
+            report_id: bytes((report_id,))
+            for report_id in self.report_ids
+            if report_id > 0
+        }
 
     def __str__(self):
         return f"{self.name} ({self.path})"
@@ -141,41 +216,103 @@ class Device:
         The report ID may be omitted if there is no report ID, or only one report ID.
         Return `None` if nothing received.
         """
-        device_path = self.get_device_path(report_id or self.report_ids[0])
-        with open(device_path, "rb+") as fd:
-            os.set_blocking(fd.fileno(), False)
-            report = fd.read(self.out_report_lengths[0])
-            if report is not None:
-                self._last_received_report = report
+        device_path = self.get_device_path(report_id or self._rid0)
+        try:
+            self._read_report(self._get_polled_fd(device_path))
+        except OSError:
+            self._close_fd(device_path)
+            raise
         return self._last_received_report
 
+    @classmethod
+    def poll_all(cls, timeout: float = None) -> List["Device"]:
+        """
+        Wait for HID OUT reports on the enabled devices, and on any other device
+        read from before, and store each one as the last received report of its
+        device.
+
+        :param timeout: Seconds to wait, `None` to wait until a report arrives
+        :return: Devices that received a report, empty if there is nothing to poll
+        :raises: OSError if a device cannot be accessed
+        """
+        # pylint: disable=protected-access
+        for device in this.devices:
+            if device._out_len0:
+                device_path = device.get_device_path()
+                try:
+                    device._get_polled_fd(device_path)
+                except OSError:
+                    device._close_fd(device_path)
+                    raise
+        if not _selector.get_map():
+            return []  # select() would wait forever
+        devices = []
+        for key, _ in _selector.select(timeout):
+            device_ref, device_path = key.data
+            device = device_ref()
+            if device is None:
+                continue  # Collected, its fds are closed with it
+            try:
+                if device._read_report(key.fd):
+                    devices.append(device)
+            except OSError:
+                device._close_fd(device_path)
+                raise
+        return devices
+
+    def _read_report(self, fd: int) -> bool:
+        """
+        Read a pending HID OUT report into the last received report.
+
+        :param fd: Non-blocking file descriptor of the HID device
+        :return: True if a report was read
+        """
+        try:
+            self._last_received_report = os.read(fd, self._out_len0)
+        except BlockingIOError:
+            return False  # Nothing received since the last read
+        return True
+
     def get_device_path(self, report_id=None):
         """
         translates the /dev/hidg device from the report id
         """
-        device = (
-            Path(
-                "%s/functions/hid.usb%s/dev"
-                % (this.gadget_root, report_id or self.report_ids[0])
-            )
-            .read_text(encoding="utf-8")
-            .strip()
-            .split(":")[1]
-        )
-        device_path = "/dev/hidg%s" % device
-        return device_path
+        return _resolve_hidg(this.gadget_root, report_id or self._rid0)
 
-    def send_report(self, report: bytearray, report_id: int = None):
+    def send_report(self, report: "ReadableBuffer", report_id: int = None):
         """Send an HID report. If the device descriptor specifies zero or one report id's,
         you can supply `None` (the default) as the value of ``report_id``.
         Otherwise you must specify which report id to use when sending the report.
+        ``report`` may be any bytes-like object, it is written without conversion.
         """
-        report_id = report_id or self.report_ids[0]
+        report_id = report_id or self._rid0
         device_path = self.get_device_path(report_id)
-        with open(device_path, "rb+") as fd:
+
+        try:
+            fd = self._get_nonblocking_fd(device_path)
+
             if report_id > 0:
-                report = bytearray(report_id.to_bytes(1, "big")) + report
-            fd.write(report)
+                # Ids missing from report_ids are still sent with their byte.
+                # Every write() is one report and f_hid has no write_iter, so
+                # writev() would send the id as a report of its own
+                prefix = self._prefix.get(report_id) or bytes((report_id,))
+                report = prefix + report
+
+            while True:
+                try:
+                    os.write(fd, report)
+                    return
+                except BlockingIOError:
+                    # The cached fd is non-blocking, wait until the host
+                    # has picked up the previous report. poll() rather than
+                    # select(), which is limited to fds below FD_SETSIZE
+                    writable = select.poll()
+                    writable.register(fd, select.POLLOUT)
+                    writable.poll()
+
+        except OSError:
+            self._close_fd(device_path)
+            raise
 
     def _get_nonblocking_fd(self, device_path: str) -> int:
         """
@@ -185,11 +322,37 @@ class Device:
         :return: File descriptor
         :raises: OSError if device cannot be opened
         """
-        if device_path in self._device_fds:
-            return self._device_fds[device_path]
+        # Lock-free once the fd is cached, dict reads are atomic
+        fd = self._device_fds.get(device_path)
+        if fd is not None:
+            return fd
+
+        with self._fd_lock:
+            # Another thread may have opened it while we waited
+            fd = self._device_fds.get(device_path)
+            if fd is not None:
+                return fd
+            fd = os.open(device_path, os.O_RDWR | os.O_NONBLOCK)
+            self._device_fds[device_path] = fd
+            return fd
+
+    def _get_polled_fd(self, device_path: str) -> int:
+        """
+        Get or create a non-blocking file descriptor for the device, registered
+        for `poll_all()`. Only the read paths register, sending needs no epoll.
 
-        fd = os.open(device_path, os.O_RDWR | os.O_NONBLOCK)
-        self._device_fds[device_path] = fd
+        :param device_path: Path to the HID device
+        :return: File descriptor
+        :raises: OSError if device cannot be opened or registered
+        """
+        fd = self._get_nonblocking_fd(device_path)
+        if fd not in _selector.get_map():
+            with self._fd_lock:
+                if fd not in _selector.get_map():
+                    # Weakly, so the selector does not keep the device alive
+                    _selector.register(
+                        fd, selectors.EVENT_READ, (weakref.ref(self), device_path)
+                    )
         return fd
 
     def _close_fd(self, device_path: str) -> None:
@@ -199,29 +362,36 @@ class Device:
         :param device_path: Path to the HID device
         """
         if device_path in self._device_fds:
+            try:
+                _selector.unregister(self._device_fds[device_path])
+            except KeyError:
+                pass
             try:
                 os.close(self._device_fds[device_path])
             except OSError:
                 pass  # Ignore errors during close
             del self._device_fds[device_path]
 
-    def send_report_nonblocking(self, report: bytearray, report_id: int = None) -> None:
+    def send_report_nonblocking(
+        self, report: "ReadableBuffer", report_id: int = None
+    ) -> None:
         """
         Send an HID report using non-blocking I/O.
 
-        :param report: The HID report to send
+        :param report: The HID report to send, any bytes-like object
         :param report_id: Optional report ID
         :raises: BlockingIOError if write would block
         :raises: OSError if device cannot be accessed
         """
-        report_id = report_id or self.report_ids[0]
+        report_id = report_id or self._rid0
         device_path = self.get_device_path(report_id)
 
         try:
             fd = self._get_nonblocking_fd(device_path)
 
             if report_id > 0:
-                report = bytearray(report_id.to_bytes(1, "big")) + report
+                prefix = self._prefix.get(report_id) or bytes((report_id,))
+                report = prefix + report
 
             os.write(fd, report)
 
@@ -232,53 +402,177 @@ class Device:
             self._close_fd(device_path)
             raise
 
-    def __del__(self):
-        """Cleanup file descriptors on object destruction"""
+    def _close_fds(self) -> None:
+        """
+        Close all cached file descriptors.
+        """
         for device_path in list(self._device_fds.keys()):
             self._close_fd(device_path)
 
+    def __del__(self):
+        """Cleanup file descriptors on object destruction"""
+        self._close_fds()
+
+
+_KEYBOARD_DESCRIPTOR = bytes.fromhex(
+    "05 01"  # usage page (generic desktop ctrls)
+    "09 06"  # usage (keyboard)
+    "A1 01"  # collection (application)
+    "85 01"  # Report ID (1)
+    "05 07"  # usage page (kbrd/keypad)
+    "19 E0"  # usage minimum (0xe0)
+    "29 E7"  # usage maximum (0xe7)
+    "15 00"  # logical minimum (0)
+    "25 01"  # logical maximum (1)
+    "75 01"  # report size (1)
+    "95 08"  # report count (8)
+    "81 02"  # input (data,var,abs,no wrap,linear,preferred state,no null position)
+    "95 01"  # report count (1)
+    "75 08"  # report size (8)
+    "81 01"  # input (const,array,abs,no wrap,linear,preferred state,no null position)
+    "95 03"  # report count (3)
+    "75 01"  # report size (1)
+    "05 08"  # usage page (leds)
+    "19 01"  # usage minimum (num lock)
+    "29 05"  # usage maximum (kana)
+    "91 02"  # output (data,var,abs,no wrap,linear,preferred state,no null position,non-volatile)
+    "95 01"  # report count (1)
+    "75 05"  # report size (5)
+    "91 01"  # output (const,array,abs,no wrap,linear,preferred state,no null position,non-volatile)
+    "95 06"  # report count (6)
+    "75 08"  # report size (8)
+    "15 00"  # logical minimum (0)
+    "26 FF 00"  # logical maximum (255)
+    "05 07"  # usage page (kbrd/keypad)
+    "19 00"  # usage minimum (0x00)
+    "2A FF 00"  # usage maximum (0xff)
+    "81 00"  # input (data,array,abs,no wrap,linear,preferred state,no null position)
+    "C0"  # end collection
+)
+
+_MOUSE_DESCRIPTOR = bytes.fromhex(
+    "05 01"  # Usage Page (Generic Desktop Ctrls)
+    "09 02"  # Usage (Mouse)
+    "A1 01"  # Collection (Application)
+    "85 02"  # Report ID (2)
+    "09 01"  # Usage (Pointer)
+    "A1 00"  # Collection (Physical)
+    "05 09"  # Usage Page (Button)
+    "19 01"  # Usage Minimum (0x01)
+    "29 05"  # Usage Maximum (0x05)
+    "15 00"  # Logical Minimum (0)
+    "25 01"  # Logical Maximum (1)
+    "95 05"  # Report Count (5)
+    "75 01"  # Report Size (1)
+    "81 02"  # Input (Data,Var,Abs,No Wrap,Linear,Preferred State,No Null Position)
+    "95 01"  # Report Count (1)
+    "75 03"  # Report Size (3)
+    "81 01"  # Input (Const,Array,Abs,No Wrap,Linear,Preferred State,No Null Position)
+    "05 01"  # Usage Page (Generic Desktop Ctrls)
+    "09 30"  # Usage (X)
+    "09 31"  # Usage (Y)
+    "15 81"  # Logical Minimum (-127)
+    "25 7F"  # Logical Maximum (127)
+    "75 08"  # Report Size (8)
+    "95 02"  # Report Count (2)
+    "81 06"  # Input (Data,Var,Rel,No Wrap,Linear,Preferred State,No Null Position)
+    "09 38"  # Usage (Wheel)
+    "15 81"  # Logical Minimum (-127)
+    "25 7F"  # Logical Maximum (127)
+    "75 08"  # Report Size (8)
+    "95 01"  # Report Count (1)
+    "81 06"  # Input (Data,Var,Rel,No Wrap,Linear,Preferred State,No Null Position)
+    "C0"  # End Collection (Physical)
+    "C0"  # End Collection (Application)
+)
+
+_CONSUMER_CONTROL_DESCRIPTOR = bytes.fromhex(
+    "05 0C"  # Usage Page (Consumer)
+    "09 01"  # Usage (Consumer Control)
+    "A1 01"  # Collection (Application)
+    "85 03"  # Report ID (3)
+    "75 10"  # Report Size (16)
+    "95 01"  # Report Count (1)
+    "15 01"  # Logical Minimum (1)
+    "26 8C 02"  # Logical Maximum (652)
+    "19 01"  # Usage Minimum (Consumer Control)
+    "2A 8C 02"  # Usage Maximum (AC Send)
+    "81 00"  # Input (Data,Array,Abs,No Wrap,Linear,Preferred State,No Null Position)
+    "C0"  # End Collection
+)
+
+_BOOT_KEYBOARD_DESCRIPTOR = bytes.fromhex(
+    "05 01"  # usage page (generic desktop ctrls)
+    "09 06"  # usage (keyboard)
+    "A1 01"  # collection (application)
+    "05 07"  # usage page (kbrd/keypad)
+    "19 E0"  # usage minimum (0xe0)
+    "29 E7"  # usage maximum (0xe7)
+    "15 00"  # logical minimum (0)
+    "25 01"  # logical maximum (1)
+    "75 01"  # report size (1)
+    "95 08"  # report count (8)
+    "81 02"  # input (data,var,abs,no wrap,linear,preferred state,no null position)
+    "95 01"  # report count (1)
+    "75 08"  # report size (8)
+    "81 01"  # input (const,array,abs,no wrap,linear,preferred state,no null position)
+    "95 03"  # report count (3)
+    "75 01"  # report size (1)
+    "05 08"  # usage page (leds)
+    "19 01"  # usage minimum (num lock)
+    "29 05"  # usage maximum (kana)
+    "91 02"  # output (data,var,abs,no wrap,linear,preferred state,no null position,non-volatile)
+    "95 01"  # report count (1)
+    "75 05"  # report size (5)
+    "91 01"  # output (const,array,abs,no wrap,linear,preferred state,no null position,non-volatile)
+    "95 06"  # report count (6)
+    "75 08"  # report size (8)
+    "15 00"  # logical minimum (0)
+    "26 FF 00"  # logical maximum (255)
+    "05 07"  # usage page (kbrd/keypad)
+    "19 00"  # usage minimum (0x00)
+    "2A FF 00"  # usage maximum (0xff)
+    "81 00"  # input (data,array,abs,no wrap,linear,preferred state,no null position)
+    "C0"  # end collection
+)
+
+_BOOT_MOUSE_DESCRIPTOR = bytes.fromhex(
+    "05 01"  # Usage Page (Generic Desktop Ctrls)
+    "09 02"  # Usage (Mouse)
+    "A1 01"  # Collection (Application)
+    "09 01"  # Usage (Pointer)
+    "A1 00"  # Collection (Physical)
+    "05 09"  # Usage Page (Button)
+    "19 01"  # Usage Minimum (0x01)
+    "29 05"  # Usage Maximum (0x05)
+    "15 00"  # Logical Minimum (0)
+    "25 01"  # Logical Maximum (1)
+    "95 05"  # Report Count (5)
+    "75 01"  # Report Size (1)
+    "81 02"  # Input (Data,Var,Abs,No Wrap,Linear,Preferred State,No Null Position)
+    "95 01"  # Report Count (1)
+    "75 03"  # Report Size (3)
+    "81 01"  # Input (Const,Array,Abs,No Wrap,Linear,Preferred State,No Null Position)
+    "05 01"  # Usage Page (Generic Desktop Ctrls)
+    "09 30"  # Usage (X)
+    "09 31"  # Usage (Y)
+    "15 81"  # Logical Minimum (-127)
+    "25 7F"  # Logical Maximum (127)
+    "75 08"  # Report Size (8)
+    "95 02"  # Report Count (2)
+    "81 06"  # Input (Data,Var,Rel,No Wrap,Linear,Preferred State,No Null Position)
+    "09 38"  # Usage (Wheel)
+    "15 81"  # Logical Minimum (-127)
+    "25 7F"  # Logical Maximum (127)
+    "75 08"  # Report Size (8)
+    "95 01"  # Report Count (1)
+    "81 06"  # Input (Data,Var,Rel,No Wrap,Linear,Preferred State,No Null Position)
+    "C0"  # End Collection
+    "C0"  # End Collection
+)
 
 Device.KEYBOARD = Device(
-    descriptor=bytes(
-        (
-            # fmt: off
-            0x05, 0x01,  # usage page (generic desktop ctrls)
-            0x09, 0x06,  # usage (keyboard)
-            0xA1, 0x01,  # collection (application)
-            0x85, 0x01,  # Report ID (1)
-            0x05, 0x07,  # usage page (kbrd/keypad)
-            0x19, 0xE0,  # usage minimum (0xe0)
-            0x29, 0xE7,  # usage maximum (0xe7)
-            0x15, 0x00,  # logical minimum (0)
-            0x25, 0x01,  # logical maximum (1)
-            0x75, 0x01,  # report size (1)
-            0x95, 0x08,  # report count (8)
-            0x81, 0x02,  # input (data,var,abs,no wrap,linear,preferred state,no null position)
-            0x95, 0x01,  # report count (1)
-            0x75, 0x08,  # report size (8)
-            0x81, 0x01,  # input (const,array,abs,no wrap,linear,preferred state,no null position)
-            0x95, 0x03,  # report count (3)
-            0x75, 0x01,  # report size (1)
-            0x05, 0x08,  # usage page (leds)
-            0x19, 0x01,  # usage minimum (num lock)
-            0x29, 0x05,  # usage maximum (kana)
-            0x91, 0x02,  # output (data,var,abs,no wrap,linear,preferred state,no null position,non-volatile)
-            0x95, 0x01,  # report count (1)
-            0x75, 0x05,  # report size (5)
-            0x91, 0x01,  # output (const,array,abs,no wrap,linear,preferred state,no null position,non-volatile)
-            0x95, 0x06,  # report count (6)
-            0x75, 0x08,  # report size (8)
-            0x15, 0x00,  # logical minimum (0)
-            0x26, 0xFF, 0x00,  # logical maximum (255)
-            0x05, 0x07,  # usage page (kbrd/keypad)
-            0x19, 0x00,  # usage minimum (0x00)
-            0x2A, 0xFF, 0x00,  # usage maximum (0xff)
-            0x81, 0x00,  # input (data,array,abs,no wrap,linear,preferred state,no null position)
-            0xC0,
-            # end collection
-            # fmt: on
-        )
-    ),
+    descriptor=_KEYBOARD_DESCRIPTOR,
     usage_page=0x1,
     usage=0x6,
     report_ids=[0x1],
@@ -288,46 +582,7 @@ Device.KEYBOARD = Device(
 )
 
 Device.MOUSE = Device(
-    descriptor=bytes(
-        (
-            # fmt: off
-            0x05, 0x01,  # Usage Page (Generic Desktop Ctrls)
-            0x09, 0x02,  # Usage (Mouse)
-            0xA1, 0x01,  # Collection (Application)
-            0x85, 0x02,  # Report ID (2)
-            0x09, 0x01,  # Usage (Pointer)
-            0xA1, 0x00,  # Collection (Physical)
-            0x05, 0x09,  # Usage Page (Button)
-            0x19, 0x01,  # Usage Minimum (0x01)
-            0x29, 0x05,  # Usage Maximum (0x05)
-            0x15, 0x00,  # Logical Minimum (0)
-            0x25, 0x01,  # Logical Maximum (1)
-            0x95, 0x05,  # Report Count (5)
-            0x75, 0x01,  # Report Size (1)
-            0x81, 0x02,  # Input (Data,Var,Abs,No Wrap,Linear,Preferred State,No Null Position)
-            0x95, 0x01,  # Report Count (1)
-            0x75, 0x03,  # Report Size (3)
-            0x81, 0x01,  # Input (Const,Array,Abs,No Wrap,Linear,Preferred State,No Null Position)
-            0x05, 0x01,  # Usage Page (Generic Desktop Ctrls)
-            0x09, 0x30,  # Usage (X)
-            0x09, 0x31,  # Usage (Y)
-            0x15, 0x81,  # Logical Minimum (-127)
-            0x25, 0x7F,  # Logical Maximum (127)
-            0x75, 0x08,  # Report Size (8)
-            0x95, 0x02,  # Report Count (2)
-            0x81, 0x06,  # Input (Data,Var,Rel,No Wrap,Linear,Preferred State,No Null Position)
-            0x09, 0x38,  # Usage (Wheel)
-            0x15, 0x81,  # Logical Minimum (-127)
-            0x25, 0x7F,  # Logical Maximum (127)
-            0x75, 0x08,  # Report Size (8)
-            0x95, 0x01,  # Report Count (1)
-            0x81, 0x06,  # Input (Data,Var,Rel,No Wrap,Linear,Preferred State,No Null Position)
-            0xC0,        # End Collection (Physical)
-            0xC0,
-            # End Collection (Application)
-            # fmt: on
-        )
-    ),
+    descriptor=_MOUSE_DESCRIPTOR,
     usage_page=0x1,
     usage=0x02,
     report_ids=[0x02],
@@ -337,25 +592,7 @@ Device.MOUSE = Device(
 )
 
 Device.CONSUMER_CONTROL = Device(
-    descriptor=bytes(
-        (
-            # fmt: off
-            0x05, 0x0C,  # Usage Page (Consumer)
-            0x09, 0x01,  # Usage (Consumer Control)
-            0xA1, 0x01,  # Collection (Application)
-            0x85, 0x03,  # Report ID (3)
-            0x75, 0x10,  # Report Size (16)
-            0x95, 0x01,  # Report Count (1)
-            0x15, 0x01,  # Logical Minimum (1)
-            0x26, 0x8C, 0x02,  # Logical Maximum (652)
-            0x19, 0x01,  # Usage Minimum (Consumer Control)
-            0x2A, 0x8C, 0x02,  # Usage Maximum (AC Send)
-            0x81, 0x00,  # Input (Data,Array,Abs,No Wrap,Linear,Preferred State,No Null Position)
-            0xC0,
-            # End Collection
-            # fmt: on
-        )
-    ),
+    descriptor=_CONSUMER_CONTROL_DESCRIPTOR,
     usage_page=0x0C,
     usage=0x01,
     report_ids=[3],
@@ -365,45 +602,7 @@ Device.CONSUMER_CONTROL = Device(
 )
 
 Device.BOOT_KEYBOARD = Device(
-    descriptor=bytes(
-        (
-            # fmt: off
-            0x05, 0x01,  # usage page (generic desktop ctrls)
-            0x09, 0x06,  # usage (keyboard)
-            0xA1, 0x01,  # collection (application)
-            0x05, 0x07,  # usage page (kbrd/keypad)
-            0x19, 0xE0,  # usage minimum (0xe0)
-            0x29, 0xE7,  # usage maximum (0xe7)
-            0x15, 0x00,  # logical minimum (0)
-            0x25, 0x01,  # logical maximum (1)
-            0x75, 0x01,  # report size (1)
-            0x95, 0x08,  # report count (8)
-            0x81, 0x02,  # input (data,var,abs,no wrap,linear,preferred state,no null position)
-            0x95, 0x01,  # report count (1)
-            0x75, 0x08,  # report size (8)
-            0x81, 0x01,  # input (const,array,abs,no wrap,linear,preferred state,no null position)
-            0x95, 0x03,  # report count (3)
-            0x75, 0x01,  # report size (1)
-            0x05, 0x08,  # usage page (leds)
-            0x19, 0x01,  # usage minimum (num lock)
-            0x29, 0x05,  # usage maximum (kana)
-            0x91, 0x02,  # output (data,var,abs,no wrap,linear,preferred state,no null position,non-volatile)
-            0x95, 0x01,  # report count (1)
-            0x75, 0x05,  # report size (5)
-            0x91, 0x01,  # output (const,array,abs,no wrap,linear,preferred state,no null position,non-volatile)
-            0x95, 0x06,  # report count (6)
-            0x75, 0x08,  # report size (8)
-            0x15, 0x00,  # logical minimum (0)
-            0x26, 0xFF, 0x00,  # logical maximum (255)
-            0x05, 0x07,  # usage page (kbrd/keypad)
-            0x19, 0x00,  # usage minimum (0x00)
-            0x2A, 0xFF, 0x00,  # usage maximum (0xff)
-            0x81, 0x00,  # input (data,array,abs,no wrap,linear,preferred state,no null position)
-            0xC0,
-            # end collection
-            # fmt: on
-        )
-    ),
+    descriptor=_BOOT_KEYBOARD_DESCRIPTOR,
     usage_page=0x1,
     usage=0x6,
     report_ids=[0x0],
@@ -413,45 +612,7 @@ Device.BOOT_KEYBOARD = Device(
 )
 
 Device.BOOT_MOUSE = Device(
-    descriptor=bytes(
-        (
-            # fmt: off
-            0x05, 0x01,  # Usage Page (Generic Desktop Ctrls)
-            0x09, 0x02,  # Usage (Mouse)
-            0xA1, 0x01,  # Collection (Application)
-            0x09, 0x01,  # Usage (Pointer)
-            0xA1, 0x00,  # Collection (Physical)
-            0x05, 0x09,  # Usage Page (Button)
-            0x19, 0x01,  # Usage Minimum (0x01)
-            0x29, 0x05,  # Usage Maximum (0x05)
-            0x15, 0x00,  # Logical Minimum (0)
-            0x25, 0x01,  # Logical Maximum (1)
-            0x95, 0x05,  # Report Count (5)
-            0x75, 0x01,  # Report Size (1)
-            0x81, 0x02,  # Input (Data,Var,Abs,No Wrap,Linear,Preferred State,No Null Position)
-            0x95, 0x01,  # Report Count (1)
-            0x75, 0x03,  # Report Size (3)
-            0x81, 0x01,  # Input (Const,Array,Abs,No Wrap,Linear,Preferred State,No Null Position)
-            0x05, 0x01,  # Usage Page (Generic Desktop Ctrls)
-            0x09, 0x30,  # Usage (X)
-            0x09, 0x31,  # Usage (Y)
-            0x15, 0x81,  # Logical Minimum (-127)
-            0x25, 0x7F,  # Logical Maximum (127)
-            0x75, 0x08,  # Report Size (8)
-            0x95, 0x02,  # Report Count (2)
-            0x81, 0x06,  # Input (Data,Var,Rel,No Wrap,Linear,Preferred State,No Null Position)
-            0x09, 0x38,  # Usage (Wheel)
-            0x15, 0x81,  # Logical Minimum (-127)
-            0x25, 0x7F,  # Logical Maximum (127)
-            0x75, 0x08,  # Report Size (8)
-            0x95, 0x01,  # Report Count (1)
-            0x81, 0x06,  # Input (Data,Var,Rel,No Wrap,Linear,Preferred State,No Null Position)
-            0xC0,        # End Collection
-            0xC0,
-            # End Collection
-            # fmt: on
-        )
-    ),
+    descriptor=_BOOT_MOUSE_DESCRIPTOR,
     usage_page=0x1,
     usage=0x02,
     report_ids=[0],
@@ -459,6 +620,27 @@ Device.BOOT_MOUSE = Device(
     out_report_lengths=[0],
     name="boot mouse gadget",
 )
+
+
+def _rmtree_configfs(path: str) -> None:
+    """
+    Remove a configfs tree bottom-up. configfs drops attributes together with
+    their directory and refuses to rmdir default groups (configs, functions,
+    strings, ...), as those go away with their parent.
+    """
+    with os.scandir(path) as it:
+        entries = list(it)
+    for entry in entries:
+        if entry.is_symlink():
+            os.unlink(entry.path)
+        elif entry.is_dir(follow_symlinks=False):
+            _rmtree_configfs(entry.path)
+    try:
+        os.rmdir(path)
+    except PermissionError:
+        pass
+
+
 def disable() -> None:
     """Do not present any USB HID devices to the host computer.
     Can be called in ``boot.py``, before USB is connected.
@@ -467,35 +649,20 @@ def disable() -> None:
     it is disabled by default. You must turn off another USB device such
     as `usb_cdc` or `storage` to free up endpoints for use by `usb_hid`.
     """
-    try:
-        Path("%s/UDC" % this.gadget_root).write_text("", encoding="utf-8")
-    except FileNotFoundError:
-        pass
+    root = this.gadget_root
+    if _gadget_bound(root):
+        # configfs fails a zero-length write with EFAULT, so unbind the way
+        # `echo "" > UDC` does
+        _write_attribute(f"{root}/UDC", b"\n")
 
-    for symlink in Path(this.gadget_root).glob("configs/**/hid.usb*"):
-        symlink.unlink()
-
-    for strings_file in Path(this.gadget_root).rglob("configs/*/strings/*/*"):
-        if strings_file.is_dir():
-            strings_file.rmdir()
-
-    for strings_file in Path(this.gadget_root).rglob("configs/*/strings/*"):
-        if strings_file.is_dir():
-            strings_file.rmdir()
-    for config_dir in Path(this.gadget_root).rglob("configs/*"):
-        if config_dir.is_dir():
-            config_dir.rmdir()
-    for function_dir in Path(this.gadget_root).rglob("functions/*"):
-        if function_dir.is_dir():
-            function_dir.rmdir()
-    for strings_file in Path(this.gadget_root).rglob("strings/*/*"):
-        if strings_file.is_dir():
-            strings_file.rmdir()
-    for strings_file in Path(this.gadget_root).rglob("strings/*"):
-        if strings_file.is_dir():
-            strings_file.rmdir()
+    for device in this.devices:
+        device._close_fds()  # pylint: disable=protected-access
+    _resolve_hidg.cache_clear()
+
+    # Functions cannot be removed while linked, so unlink configs first
     try:
-        Path(this.gadget_root).rmdir()
+        _rmtree_configfs(f"{root}/configs")
+        _rmtree_configfs(root)
     except FileNotFoundError:
         pass
     this.devices = []
@@ -504,6 +671,231 @@ def disable() -> None:
 atexit.register(disable)
 
 
+@contextlib.contextmanager
+def _open_dir(path: str, dir_fd: int = None) -> Iterator[int]:
+    """
+    Open a configfs directory, so that its entries can be accessed relative to it.
+
+    :param path: Path of the directory
+    :param dir_fd: Directory fd ``path`` is relative to
+    :return: Directory fd, closed on exit
+    """
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY, dir_fd=dir_fd)
+    try:
+        yield fd
+    finally:
+        os.close(fd)
+
+
+def _write_attribute(path: str, value: bytes, dir_fd: int = None) -> None:
+    """
+    Write a single configfs attribute.
+
+    :param path: Path of the attribute
+    :param value: Value to store
+    :param dir_fd: Directory fd ``path`` is relative to
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644, dir_fd=dir_fd)
+    try:
+        os.write(fd, value)
+    finally:
+        os.close(fd)
+
+
+def _write_attributes(dir_fd: int, attributes: Sequence[Tuple[str, bytes]]) -> None:
+    """
+    Write a batch of configfs attributes of one directory, in order.
+
+    :param dir_fd: Directory fd holding the attributes
+    :param attributes: ``(name, value)`` pairs
+    """
+    for name, value in attributes:
+        _write_attribute(name, value, dir_fd)
+
+
+def _setup_hid_function(
+    functions_fd: int,
+    config_fd: int,
+    report_id: int,
+    report_length: int,
+    descriptor: bytes,
+) -> None:
+    """
+    Configure the HID function of one report id and link it into the configuration.
+
+    :param functions_fd: Directory fd of the gadget's functions, holding the function
+    :param config_fd: Directory fd of the configuration to link the function into
+    :param report_id: Report id, also the function's instance number
+    :param report_length: Length of the function's IN reports
+    :param descriptor: HID report descriptor
+    """
+    function_name = f"hid.usb{report_id}"
+    function_root = f"{this.gadget_root}/functions/{function_name}"
+    # f_hid rejects attribute writes with EBUSY once the function is linked,
+    # so this runs only for functions not linked into the configuration yet
+    with _open_dir(function_name, functions_fd) as function_fd:
+        _write_attributes(
+            function_fd,
+            (
+                ("protocol", b"%d" % report_id),
+                ("report_length", b"%d" % report_length),
+                ("subclass", b"1"),
+                ("report_desc", descriptor),
+            ),
+        )
+    # """
+    # 4. Associating the functions with their configurations
+    # ------------------------------------------------------
+    #
+    # At this moment a number of gadgets is created, each of which has a number of
+    # configurations specified and a number of functions available. What remains
+    # is specifying which function is available in which configuration (the same
+    # function can be used in multiple configurations). This is achieved with
+    # creating symbolic links::
+    #
+    #     $ ln -s functions/<name>.<instance name> configs/<name>.<number>
+    #
+    # e.g.::
+    #
+    #     $ ln -s functions/ncm.usb0 configs/c.1  """
+    os.symlink(function_root, function_name, dir_fd=config_fd)
+
+
+def _read_attribute(path: str, dir_fd: int = None) -> bytes:
+    """
+    Read a single configfs attribute.
+
+    :param path: Path of the attribute
+    :param dir_fd: Directory fd ``path`` is relative to
+    :return: Value of the attribute, configfs returns at most a page
+    """
+    fd = os.open(path, os.O_RDONLY, dir_fd=dir_fd)
+    try:
+        return os.read(fd, 4096)
+    finally:
+        os.close(fd)
+
+
+def _hid_functions(devices: Sequence[Device]) -> Dict[str, Tuple[int, int, bytes]]:
+    """
+    Collect the HID functions needed by the devices, one per report id.
+
+    :param devices: Requested devices
+    :return: ``(report_id, report_length, descriptor)`` by function name
+    :raises ValueError: if devices ask for one report id with different settings
+    """
+    functions: Dict[str, Tuple[int, int, bytes]] = {}
+    for device in devices:
+        descriptor = device.descriptor
+        for report_id, report_length in zip(
+            device.report_ids, device.in_report_lengths
+        ):
+            function = (report_id, report_length, descriptor)
+            if functions.setdefault(f"hid.usb{report_id}", function) != function:
+                raise ValueError(
+                    "report id %d is used by devices with different settings"
+                    % report_id
+                )
+    return functions
+
+
+def _hid_function_matches(
+    functions_fd: int, function_name: str, report_length: int, descriptor: bytes
+) -> bool:
+    """
+    Check whether an existing HID function is set up as requested.
+
+    :param functions_fd: Directory fd of the gadget's functions, holding the function
+    :param function_name: Name of the function
+    :param report_length: Requested length of the function's IN reports
+    :param descriptor: Requested HID report descriptor
+    :return: True if both match the function's attributes
+    """
+    with _open_dir(function_name, functions_fd) as function_fd:
+        return (
+            _read_attribute("report_length", function_fd).strip()
+            == b"%d" % report_length
+            and _read_attribute("report_desc", function_fd) == descriptor
+        )
+
+
+def _check_bound_functions(
+    gadget_root: str, hid_functions: Dict[str, Tuple[int, int, bytes]]
+) -> None:
+    """
+    Check that a bound gadget already provides the requested HID functions.
+
+    :param gadget_root: Path of the gadget
+    :param hid_functions: Requested functions, as from `_hid_functions()`
+    :raises ValueError: if a function is missing, unlinked or set up differently
+    """
+    linked = set(os.listdir(f"{gadget_root}/configs/c.1"))
+    with _open_dir(f"{gadget_root}/functions") as functions_fd:
+        functions = set(os.listdir(functions_fd))
+        for function_name, (_, report_length, descriptor) in hid_functions.items():
+            if function_name not in functions:
+                problem = "is missing from"
+            elif function_name not in linked:
+                problem = "is not linked into"
+            elif not _hid_function_matches(
+                functions_fd, function_name, report_length, descriptor
+            ):
+                problem = "is set up for other devices in"
+            else:
+                continue
+            raise ValueError(
+                "%s %s the bound gadget, disable() it first" % (function_name, problem)
+            )
+
+
+def _gadget_bound(gadget_root: str) -> bool:
+    """
+    Check whether the gadget is already bound to a UDC.
+
+    :param gadget_root: Path of the gadget
+    :return: True if the gadget's UDC attribute is set
+    """
+    try:
+        fd = os.open(f"{gadget_root}/UDC", os.O_RDONLY)
+    except FileNotFoundError:
+        return False
+    try:
+        return bool(os.read(fd, 64).strip())
+    finally:
+        os.close(fd)
+
+
+# Device descriptor attributes of the gadget, as written to configfs
+_GADGET_ATTRIBUTES: Tuple[Tuple[str, bytes], ...] = (
+    ("bcdDevice", b"1"),  # Version 1.0.0
+    ("bcdUSB", b"512"),  # 0x0200, USB 2.0
+    ("bDeviceClass", b"0"),  # multipurpose i guess?
+    ("bDeviceProtocol", b"0"),
+    ("bDeviceSubClass", b"0"),
+    ("bMaxPacketSize0", b"8"),
+    ("idProduct", b"260"),  # 0x0104, Multifunction Composite Gadget
+    ("idVendor", b"7531"),  # 0x1D6B, Linux Foundation
+)
+
+# US English (0x409) strings of the gadget
+_GADGET_STRINGS: Tuple[Tuple[str, bytes], ...] = (
+    ("serialnumber", b"213374badcafe"),
+    ("manufacturer", b"quaxalber"),
+    ("product", b"USB Combo Device"),
+)
+
+# Attributes of the gadget's only configuration, c.1
+_CONFIG_ATTRIBUTES: Tuple[Tuple[str, bytes], ...] = (
+    ("MaxPower", b"250"),
+    ("bmAttributes", b"128"),  # 0x80
+)
+
+# US English (0x409) strings of configuration c.1
+_CONFIG_STRINGS: Tuple[Tuple[str, bytes], ...] = (
+    ("configuration", b"Config 1: ECM network"),
+)
+
+
 def enable(requested_devices: Sequence[Device], boot_device: int = 0) -> None:
     """Specify which USB HID devices that will be available.
     Can be called in ``boot.py``, before USB is connected.
@@ -546,6 +938,7 @@ def enable(requested_devices: Sequence[Device], boot_device: int = 0) -> None:
     If you specify a non-zero ``boot_device``, and it is not the first device, CircuitPython
     will enter safe mode to report this error.
     """
+    # pylint: disable=too-many-locals
     this.boot_device = boot_device
 
     if len(requested_devices) == 0:
@@ -557,6 +950,16 @@ def enable(requested_devices: Sequence[Device], boot_device: int = 0) -> None:
     if boot_device == 2:
         requested_devices = [Device.BOOT_MOUSE]
 
+    hid_functions = _hid_functions(requested_devices)
+    root = this.gadget_root
+    if _gadget_bound(root):
+        # configfs refuses to reconfigure a bound gadget, so use it as it is
+        _check_bound_functions(root, hid_functions)
+        this.devices.extend(requested_devices)
+        for device in requested_devices:
+            device.path = device.get_device_path()
+        return
+
     # """
     # 1. Creating the gadgets
     # -----------------------
@@ -592,84 +995,57 @@ def enable(requested_devices: Sequence[Device], boot_device: int = 0) -> None:
     #     $ echo <manufacturer> > strings/0x409/manufacturer
     #     $ echo <product> > strings/0x409/product
     # """
-    Path("%s/functions" % this.gadget_root).mkdir(parents=True, exist_ok=True)
-    Path("%s/configs" % this.gadget_root).mkdir(parents=True, exist_ok=True)
-    Path("%s/bcdDevice" % this.gadget_root).write_text(
-        "%s" % 1, encoding="utf-8"
-    )  # Version 1.0.0
-    Path("%s/bcdUSB" % this.gadget_root).write_text(
-        "%s" % 0x0200, encoding="utf-8"
-    )  # USB 2.0
-    Path("%s/bDeviceClass" % this.gadget_root).write_text(
-        "%s" % 0x00, encoding="utf-8"
-    )  # multipurpose i guess?
-    Path("%s/bDeviceProtocol" % this.gadget_root).write_text(
-        "%s" % 0x00, encoding="utf-8"
-    )
-    Path("%s/bDeviceSubClass" % this.gadget_root).write_text(
-        "%s" % 0x00, encoding="utf-8"
-    )
-    Path("%s/bMaxPacketSize0" % this.gadget_root).write_text(
-        "%s" % 0x08, encoding="utf-8"
-    )
-    Path("%s/idProduct" % this.gadget_root).write_text(
-        "%s" % 0x0104, encoding="utf-8"
-    )  # Multifunction Composite Gadget
-    Path("%s/idVendor" % this.gadget_root).write_text(
-        "%s" % 0x1D6B, encoding="utf-8"
-    )  # Linux Foundation
-    Path("%s/strings/0x409" % this.gadget_root).mkdir(parents=True, exist_ok=True)
-    Path("%s/strings/0x409/serialnumber" % this.gadget_root).write_text(
-        "213374badcafe", encoding="utf-8"
-    )
-    Path("%s/strings/0x409/manufacturer" % this.gadget_root).write_text(
-        "quaxalber", encoding="utf-8"
-    )
-    Path("%s/strings/0x409/product" % this.gadget_root).write_text(
-        "USB Combo Device", encoding="utf-8"
-    )
-    # """
-    # 2. Creating the configurations
-    # ------------------------------
-    #
-    # Each gadget will consist of a number of configurations, their corresponding
-    # directories must be created:
-    #
-    # $ mkdir configs/<name>.<number>
-    #
-    # where <name> can be any string which is legal in a filesystem and the
-    # <number> is the configuration's number, e.g.::
-    #
-    #     $ mkdir configs/c.1
-    #
-    #     ...
-    #     ...
-    #     ...
-    #
-    # Each configuration also needs its strings, so a subdirectory must be created
-    # for each language, e.g.::
-    #
-    #     $ mkdir configs/c.1/strings/0x409
-    #
-    # Then the configuration string can be specified::
-    #
-    #     $ echo <configuration> > configs/c.1/strings/0x409/configuration
-    #
-    # Some attributes can also be set for a configuration, e.g.::
-    #
-    #     $ echo 120 > configs/c.1/MaxPower
-    #     """
-
-    for device in requested_devices:
-        config_root = "%s/configs/c.1" % this.gadget_root
-        Path("%s/" % config_root).mkdir(parents=True, exist_ok=True)
-        Path("%s/strings/0x409" % config_root).mkdir(parents=True, exist_ok=True)
-        Path("%s/strings/0x409/configuration" % config_root).write_text(
-            "Config 1: ECM network", encoding="utf-8"
-        )
-        Path("%s/MaxPower" % config_root).write_text("250", encoding="utf-8")
-        Path("%s/bmAttributes" % config_root).write_text("%s" % 0x080, encoding="utf-8")
-        this.devices.append(device)
+    os.makedirs(f"{root}/functions", exist_ok=True)
+    os.makedirs(f"{root}/configs", exist_ok=True)
+    with contextlib.ExitStack() as dir_fds:
+        root_fd = dir_fds.enter_context(_open_dir(root))
+        functions_fd = dir_fds.enter_context(_open_dir("functions", root_fd))
+        _write_attributes(root_fd, _GADGET_ATTRIBUTES)
+        os.makedirs(f"{root}/strings/0x409", exist_ok=True)
+        strings_fd = dir_fds.enter_context(_open_dir("strings/0x409", root_fd))
+        _write_attributes(strings_fd, _GADGET_STRINGS)
+        # """
+        # 2. Creating the configurations
+        # ------------------------------
+        #
+        # Each gadget will consist of a number of configurations, their corresponding
+        # directories must be created:
+        #
+        # $ mkdir configs/<name>.<number>
+        #
+        # where <name> can be any string which is legal in a filesystem and the
+        # <number> is the configuration's number, e.g.::
+        #
+        #     $ mkdir configs/c.1
+        #
+        #     ...
+        #     ...
+        #     ...
+        #
+        # Each configuration also needs its strings, so a subdirectory must be created
+        # for each language, e.g.::
+        #
+        #     $ mkdir configs/c.1/strings/0x409
+        #
+        # Then the configuration string can be specified::
+        #
+        #     $ echo <configuration> > configs/c.1/strings/0x409/configuration
+        #
+        # Some attributes can also be set for a configuration, e.g.::
+        #
+        #     $ echo 120 > configs/c.1/MaxPower
+        #     """
+
+        os.makedirs(f"{root}/configs/c.1/strings/0x409", exist_ok=True)
+        config_fd = dir_fds.enter_context(_open_dir("configs/c.1", root_fd))
+        with _open_dir("strings/0x409", config_fd) as config_strings_fd:
+            _write_attributes(config_strings_fd, _CONFIG_STRINGS)
+        _write_attributes(config_fd, _CONFIG_ATTRIBUTES)
+
+        # Functions left over from an earlier enable() are reused, not recreated
+        functions = set(os.listdir(functions_fd))
+        linked = set(os.listdir(config_fd))
+        this.devices.extend(requested_devices)
         # """
         # 3. Creating the functions
         # -------------------------
@@ -692,57 +1068,44 @@ def enable(requested_devices: Sequence[Device], boot_device: int = 0) -> None:
         # or read-write access. Where applicable they need to be written to as
         # appropriate.
         # Please refer to Documentation/ABI/*/configfs-usb-gadget* for more information.  """
-        for report_index, report_id in enumerate(device.report_ids):
-            function_root = "%s/functions/hid.usb%s" % (this.gadget_root, report_id)
-            try:
-                Path("%s/" % function_root).mkdir(parents=True)
-            except FileExistsError:
-                continue
-            Path("%s/protocol" % function_root).write_text(
-                "%s" % report_id, encoding="utf-8"
-            )
-            Path("%s/report_length" % function_root).write_text(
-                "%s" % device.in_report_lengths[report_index], encoding="utf-8"
+        for function_name, function in hid_functions.items():
+            report_id, report_length, descriptor = function
+            if function_name not in functions:
+                os.mkdir(function_name, dir_fd=functions_fd)
+            elif function_name in linked:
+                if _hid_function_matches(
+                    functions_fd, function_name, report_length, descriptor
+                ):
+                    continue
+                # Set up for other devices. f_hid only accepts new attributes
+                # once the function is no longer linked
+                os.unlink(function_name, dir_fd=config_fd)
+            _setup_hid_function(
+                functions_fd,
+                config_fd,
+                report_id,
+                report_length,
+                descriptor,
             )
-            Path("%s/subclass" % function_root).write_text("%s" % 1, encoding="utf-8")
-            Path("%s/report_desc" % function_root).write_bytes(device.descriptor)
-            # """
-            # 4. Associating the functions with their configurations
-            # ------------------------------------------------------
-            #
-            # At this moment a number of gadgets is created, each of which has a number of
-            # configurations specified and a number of functions available. What remains
-            # is specifying which function is available in which configuration (the same
-            # function can be used in multiple configurations). This is achieved with
-            # creating symbolic links::
-            #
-            #     $ ln -s functions/<name>.<instance name> configs/<name>.<number>
-            #
-            # e.g.::
-            #
-            #     $ ln -s functions/ncm.usb0 configs/c.1  """
-            try:
-                Path("%s/hid.usb%s" % (config_root, report_id)).symlink_to(
-                    function_root
-                )
-            except FileNotFoundError:
-                pass
 
-    # """ 5. Enabling the gadget
-    # ----------------------
-    # Such a gadget must be finally enabled so that the USB host can enumerate it.
-    #
-    # In order to enable the gadget it must be bound to a UDC (USB Device
-    # Controller)::
-    #
-    #     $ echo <udc name> > UDC
-    #
-    # where <udc name> is one of those found in /sys/class/udc/*
-    # e.g.::
-    #
-    # $ echo s3c-hsotg > UDC  """
-    udc = next(Path("/sys/class/udc/").glob("*"))
-    Path("%s/UDC" % this.gadget_root).write_text("%s" % udc.name, encoding="utf-8")
+        # """ 5. Enabling the gadget
+        # ----------------------
+        # Such a gadget must be finally enabled so that the USB host can enumerate it.
+        #
+        # In order to enable the gadget it must be bound to a UDC (USB Device
+        # Controller)::
+        #
+        #     $ echo <udc name> > UDC
+        #
+        # where <udc name> is one of those found in /sys/class/udc/*
+        # e.g.::
+        #
+        # $ echo s3c-hsotg > UDC  """
+        # configfs applies every attribute within its write(), and all of them
+        # are closed by now, so binding needs no sync barrier beforehand
+        with os.scandir("/sys/class/udc/") as udcs:
+            udc_name = next(udcs).name
+        _write_attribute("UDC", udc_name.encode("ascii"), root_fd)
 
     for device in requested_devices:
         device.path = device.get_device_path()
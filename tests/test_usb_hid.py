@@ -0,0 +1,322 @@
+# SPDX-FileCopyrightText: 2025 quaxalber
+#
+# SPDX-License-Identifier: MIT
+import array
+import errno
+import functools
+import gc
+import os
+import select
+import sys
+import threading
+import pytest
+import usb_hid
+
+# pylint: disable=protected-access,redefined-outer-name,no-member,unused-argument
+
+
+def _make_device(descriptor=b"", report_ids=(0,)):
+    return usb_hid.Device(
+        descriptor=descriptor,
+        usage_page=0x01,
+        usage=0x06,
+        report_ids=report_ids,
+        in_report_lengths=[8],
+        out_report_lengths=[1],
+        name="test device",
+    )
+
+
+@pytest.fixture
+def fifo(tmp_path, monkeypatch):
+    """A FIFO as the HID node of every report id, fed from the test."""
+    path = str(tmp_path / "hidg0")
+    os.mkfifo(path)
+    monkeypatch.setattr(usb_hid, "_resolve_hidg", lambda gadget_root, report_id: path)
+    monkeypatch.setattr(usb_hid, "devices", [])
+    return path
+
+
+@pytest.fixture
+def gadget(tmp_path, monkeypatch):
+    """A plain directory as the configfs gadget, with one UDC to bind to."""
+    root = tmp_path / "gadget"
+    udc_root = tmp_path / "udc"
+    (udc_root / "dummy_udc.0").mkdir(parents=True)
+    scandir = os.scandir
+    monkeypatch.setattr(
+        os,
+        "scandir",
+        lambda path=".": scandir(udc_root if path == "/sys/class/udc/" else path),
+    )
+    monkeypatch.setattr(usb_hid, "gadget_root", str(root))
+    monkeypatch.setattr(usb_hid, "devices", [])
+    # No hidg nodes without the kernel, keep the lookup cached like the real one
+    resolve_hidg = functools.lru_cache()(lambda gadget_root, report_id: "")
+    monkeypatch.setattr(usb_hid, "_resolve_hidg", resolve_hidg)
+    return root
+
+
+def _unbind(root):
+    (root / "UDC").write_bytes(b"")
+
+
+@pytest.fixture
+def fifo_device(fifo):
+    device = _make_device()
+    yield device, fifo
+    device._close_fds()
+
+
+def test_poll_all_returns_without_devices(monkeypatch):
+    """poll_all() does not block forever when there is nothing to poll."""
+    monkeypatch.setattr(usb_hid, "devices", [])
+    assert not usb_hid._selector.get_map()
+    assert not usb_hid.Device.poll_all()
+
+
+def test_poll_all_reads_enabled_device(fifo_device):
+    """poll_all() opens enabled devices itself and stores their OUT reports."""
+    device, fifo = fifo_device
+    usb_hid.devices.append(device)
+    assert not usb_hid.Device.poll_all(0)
+    writer = os.open(fifo, os.O_WRONLY | os.O_NONBLOCK)
+    try:
+        os.write(writer, b"\x05")
+        assert usb_hid.Device.poll_all(1) == [device]
+    finally:
+        os.close(writer)
+    assert device.get_last_received_report() == b"\x05"
+
+
+def test_read_report_without_pending_report(fifo_device):
+    """_read_report() keeps the last report when nothing is pending."""
+    device, fifo = fifo_device
+    fd = device._get_polled_fd(fifo)
+    assert device._read_report(fd) is False
+    assert device._last_received_report is None
+
+
+def test_send_report_does_not_register(fifo_device):
+    """Sending alone does not register the device fd for polling."""
+    device, _ = fifo_device
+    device.send_report(b"\x00" * 8)
+    assert not usb_hid._selector.get_map()
+
+
+def test_poll_selector_does_not_keep_device_alive(fifo):
+    """A device only read from is collected, and its fd is closed with it."""
+    device = _make_device()
+    fd = device._get_polled_fd(fifo)
+    del device
+    gc.collect()
+    assert not usb_hid._selector.get_map()
+    with pytest.raises(OSError):
+        os.fstat(fd)
+
+
+def test_send_report_prefixes_unlisted_report_id(fifo_device):
+    """Report ids > 0 are prepended even when not in the device's report_ids."""
+    device, fifo = fifo_device
+    reader = os.open(fifo, os.O_RDONLY | os.O_NONBLOCK)
+    try:
+        device.send_report(b"\x01\x02", report_id=3)
+        assert os.read(reader, 8) == b"\x03\x01\x02"
+    finally:
+        os.close(reader)
+
+
+def test_device_rejects_empty_report_ids(monkeypatch):
+    """Empty report_ids raise ValueError, and __del__ copes with the partial device."""
+    unraisable = []
+    monkeypatch.setattr(sys, "unraisablehook", unraisable.append)
+    with pytest.raises(ValueError):
+        usb_hid.Device(
+            descriptor=b"",
+            usage_page=0x01,
+            usage=0x06,
+            report_ids=[],
+            in_report_lengths=[],
+            out_report_lengths=[],
+            name="test device",
+        )
+    gc.collect()
+    assert not unraisable
+
+
+def test_device_rejects_missing_in_report_lengths():
+    """Devices without an IN report length per report id are rejected up front."""
+    with pytest.raises(ValueError):
+        usb_hid.Device(
+            descriptor=b"",
+            usage_page=0x01,
+            usage=0x06,
+            report_ids=[1, 2],
+            in_report_lengths=[8],
+            out_report_lengths=[1],
+            name="test device",
+        )
+
+
+def test_enable_keeps_matching_linked_function(gadget, monkeypatch):
+    """A leftover function linked with the requested settings is reused as is."""
+    device = _make_device(b"\x05\x01", report_ids=(1,))
+    usb_hid.enable([device])
+    _unbind(gadget)
+    setups = []
+    monkeypatch.setattr(
+        usb_hid, "_setup_hid_function", lambda *args: setups.append(args)
+    )
+    usb_hid.enable([device, device])
+    assert not setups
+    assert os.path.islink(gadget / "configs/c.1/hid.usb1")
+
+
+def test_enable_reconfigures_mismatched_linked_function(gadget):
+    """A leftover function linked with other settings is unlinked and set up again."""
+    usb_hid.enable([_make_device(b"\x05\x01", report_ids=(1,))])
+    _unbind(gadget)
+    usb_hid.enable([_make_device(b"\x05\x0c", report_ids=(1,))])
+    assert (gadget / "functions/hid.usb1/report_desc").read_bytes() == b"\x05\x0c"
+    assert os.readlink(gadget / "configs/c.1/hid.usb1") == str(
+        gadget / "functions/hid.usb1"
+    )
+
+
+def test_enable_rejects_conflicting_report_ids(gadget):
+    """Two devices setting up one report id differently fail before any change."""
+    with pytest.raises(ValueError):
+        usb_hid.enable(
+            [
+                _make_device(b"\x05\x01", report_ids=(1,)),
+                _make_device(b"\x05\x0c", report_ids=(1,)),
+            ]
+        )
+    assert not gadget.exists()
+    assert not usb_hid.devices
+
+
+def test_enable_reuses_bound_gadget(gadget, monkeypatch):
+    """A bound gadget that provides the requested functions is used as it is."""
+    device = _make_device(b"\x05\x01", report_ids=(1,))
+    usb_hid.enable([device])
+    monkeypatch.setattr(usb_hid, "devices", [])
+    setups = []
+    monkeypatch.setattr(
+        usb_hid, "_setup_hid_function", lambda *args: setups.append(args)
+    )
+    usb_hid.enable([device])
+    assert not setups
+    assert usb_hid.devices == [device]
+
+
+@pytest.mark.parametrize(
+    "descriptor, report_id",
+    [(b"\x05\x01", 2), (b"\x05\x0c", 1)],
+    ids=["missing", "set up differently"],
+)
+def test_enable_rejects_bound_gadget_of_other_devices(gadget, descriptor, report_id):
+    """A bound gadget without the requested functions raises a clear error."""
+    usb_hid.enable([_make_device(b"\x05\x01", report_ids=(1,))])
+    with pytest.raises(ValueError, match="bound gadget"):
+        usb_hid.enable([_make_device(descriptor, report_ids=(report_id,))])
+    assert len(usb_hid.devices) == 1
+
+
+def test_enable_rejects_bound_gadget_with_unlinked_function(gadget):
+    """A requested function that is not linked into the bound gadget is reported."""
+    device = _make_device(b"\x05\x01", report_ids=(1,))
+    usb_hid.enable([device])
+    os.unlink(gadget / "configs/c.1/hid.usb1")
+    with pytest.raises(ValueError, match="not linked"):
+        usb_hid.enable([device])
+
+
+# configfs groups created along with their parent, which refuse rmdir
+DEFAULT_GROUPS = {"configs", "functions", "strings", "os_desc"}
+
+
+@pytest.fixture
+def configfs_rmdir(monkeypatch):
+    """os.rmdir with the configfs rules for removing gadget directories."""
+    rmdir = os.rmdir
+
+    def drop(path):
+        for name in os.listdir(path):
+            drop(os.path.join(path, name))
+        rmdir(path)
+
+    def configfs_rmdir(path):
+        path = str(path)
+        if os.path.basename(path) in DEFAULT_GROUPS:
+            raise PermissionError(errno.EPERM, os.strerror(errno.EPERM), path)
+        assert set(os.listdir(path)) <= DEFAULT_GROUPS, "group is not empty"
+        if os.path.basename(os.path.dirname(path)) == "functions":
+            config = os.path.join(usb_hid.gadget_root, "configs/c.1")
+            assert not os.path.exists(config), "function is still linked"
+        drop(path)  # Default groups go away with their parent
+
+    monkeypatch.setattr(os, "rmdir", configfs_rmdir)
+
+
+def test_disable_removes_gadget(gadget, configfs_rmdir):
+    """disable() unlinks, then removes the whole gadget tree bottom-up."""
+    for path in ("functions/hid.usb1", "strings/0x409", "configs/c.1/strings/0x409"):
+        os.makedirs(gadget / path)
+    os.symlink(gadget / "functions/hid.usb1", gadget / "configs/c.1/hid.usb1")
+    usb_hid.disable()
+    assert not gadget.exists()
+
+
+def test_disable_without_gadget(gadget, configfs_rmdir):
+    """disable() does nothing when there is no gadget."""
+    usb_hid.disable()
+    assert not gadget.exists()
+
+
+def test_send_report_waits_for_room(fifo_device, monkeypatch):
+    """send_report() waits with poll() while the HID node is full, then sends."""
+    device, fifo = fifo_device
+    reader = os.open(fifo, os.O_RDONLY | os.O_NONBLOCK)
+    writer = os.open(fifo, os.O_WRONLY | os.O_NONBLOCK)
+    polls = []
+    poll = select.poll
+    monkeypatch.setattr(select, "poll", lambda: polls.append(None) or poll())
+    drained = []
+    drain = threading.Timer(0.1, lambda: drained.append(os.read(reader, 1 << 20)))
+    try:
+        with pytest.raises(BlockingIOError):
+            while True:
+                os.write(writer, b"\xff" * 8)  # Report sized, so no room is left
+        drain.start()
+        device.send_report(b"\x01" * 8)
+        drain.join()
+        assert polls
+        assert set(drained[0]) == {0xFF}
+        assert os.read(reader, 64) == b"\x01" * 8
+    finally:
+        drain.cancel()
+        os.close(writer)
+        os.close(reader)
+
+
+@pytest.mark.parametrize(
+    "report",
+    [
+        bytearray(b"\x01\x02\x03"),
+        memoryview(b"\x00\x01\x02\x03")[1:],
+        array.array("B", [1, 2, 3]),
+    ],
+    ids=["bytearray", "memoryview", "array"],
+)
+def test_send_report_accepts_buffers(fifo, report):
+    """Any bytes-like report is sent unchanged, after its report id."""
+    device = _make_device(report_ids=(2,))
+    reader = os.open(fifo, os.O_RDONLY | os.O_NONBLOCK)
+    try:
+        device.send_report(report)
+        device.send_report_nonblocking(report)
+        assert os.read(reader, 64) == b"\x02\x01\x02\x03" * 2
+    finally:
+        os.close(reader)
+        device._close_fds()